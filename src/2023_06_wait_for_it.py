@@ -1,3 +1,5 @@
+import math
+import random
 from typing import List
 
 import utils
@@ -22,6 +24,25 @@ def parse_distance(line) -> List[int]:
 
 
 def count_solutions(time: int, record: int) -> int:
+    # Winning hold times i satisfy i * (time - i) > record, i.e. they lie strictly
+    # between the roots of i^2 - time * i + record = 0
+    if time <= 0:
+        return 0
+    middle = time // 2
+    if middle * (time - middle) <= record:
+        return 0
+    discriminant = time * time - 4 * record
+    low = (time - math.isqrt(discriminant)) // 2
+    # isqrt floors, so nudge low onto the first winning hold time
+    while low * (time - low) <= record:
+        low += 1
+    while (low - 1) * (time - low + 1) > record:
+        low -= 1
+    high = time - low
+    return min(high, time - 1) - max(low, 0) + 1
+
+
+def count_solutions_brute_force(time: int, record: int) -> int:
     count = 0
     for i in range(time):
         speed = i
@@ -48,9 +69,22 @@ def solution(filename):
     print(count_solutions(total_time, total_distance))
 
 
+def check_count_solutions(trials: int = 2000, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    for _ in range(trials):
+        time = rng.randint(0, 200)
+        record = rng.randint(-50, time * time // 4 + 10)
+        expected = count_solutions_brute_force(time, record)
+        assert count_solutions(time, record) == expected, (time, record, expected)
+
+
 def test_samples():
-    lines = utils.read_by_line("src/2023_06_wait_for_it_sample.txt")
-    pass
+    lines = list(utils.read_by_line("src/2023_06_wait_for_it_sample.txt"))
+    times = parse_time(lines[0])
+    distance = parse_distance(lines[1])
+    assert [count_solutions(time, distance[i]) for i, time in enumerate(times)] == [4, 8, 9]
+    assert count_solutions(71530, 940200) == 71503
+    check_count_solutions()
 
 
 if __name__ == "__main__":
@@ -1,5 +1,6 @@
 from collections import Counter
 from enum import Enum
+from typing import Dict, Iterable, List, Tuple, Type
 
 import utils
 
@@ -14,6 +15,46 @@ class HandLabel(Enum):
     HIGH_CARD = 1
 
 
+# Sorted card counts of a hand mapped to its label
+SIGNATURE_LABELS = {
+    (5,): HandLabel.FIVE_OF_A_KIND,
+    (4, 1): HandLabel.FOUR_OF_A_KIND,
+    (3, 2): HandLabel.FULL_HOUSE,
+    (3, 1, 1): HandLabel.THREE_OF_A_KIND,
+    (2, 2, 1): HandLabel.TWO_PAIR,
+    (2, 1, 1, 1): HandLabel.ONE_PAIR,
+    (1, 1, 1, 1, 1): HandLabel.HIGH_CARD,
+}
+
+
+def partitions(total: int, largest: int) -> List[Tuple[int, ...]]:
+    # Non-increasing tuples of positive ints summing to total, with no part above largest
+    if total == 0:
+        return [()]
+    out = []
+    for part in range(min(total, largest), 0, -1):
+        out.extend((part,) + rest for rest in partitions(total - part, part))
+    return out
+
+
+def build_label_table() -> Dict[Tuple[Tuple[int, ...], int], HandLabel]:
+    # (sorted counts of the non-joker cards, joker count) -> label. Jokers always
+    # join the most common card, which is never worse than any other choice.
+    table = {}
+    for jokers in range(6):
+        for signature in partitions(5 - jokers, 5):
+            best = (signature[0] + jokers,) + signature[1:] if signature else (5,)
+            table[(signature, jokers)] = SIGNATURE_LABELS[best]
+    return table
+
+
+LABEL_TABLE = build_label_table()
+
+
+def classify(counts: Iterable[int], jokers: int = 0) -> HandLabel:
+    return LABEL_TABLE[(tuple(sorted(counts, reverse=True)), jokers)]
+
+
 class CamelCards:
     def __init__(self, filename, with_jokers=True):
         self.hands = []
@@ -29,152 +70,112 @@ class CamelCards:
                 self.hands.append(Hand(line))
 
     def compute_total_winnings(self) -> int:
-        hands = sorted(self.hands)
-        winnings = 0
-        for i, hand in enumerate(hands):
-            rank = i + 1
-            winnings += hand.bid * rank
-        return winnings
+        return total_winnings([(hand.key, hand.bid) for hand in self.hands])
+
+
+def total_winnings(keyed_bids: List[Tuple[int, int]]) -> int:
+    winnings = 0
+    for i, (_, bid) in enumerate(sorted(keyed_bids, key=lambda keyed_bid: keyed_bid[0])):
+        rank = i + 1
+        winnings += bid * rank
+    return winnings
 
 
 class Hand:
+    # Slots keep each hand to its four fields; the rank table is shared by the class
+    __slots__ = ("cards", "bid", "label", "key")
+
+    cards_rank = {
+        "A": 13,
+        "K": 12,
+        "Q": 11,
+        "J": 10,
+        "T": 9,
+        "9": 8,
+        "8": 7,
+        "7": 6,
+        "6": 5,
+        "5": 4,
+        "4": 3,
+        "3": 2,
+        "2": 1,
+    }
+
     def __init__(self, raw_hand: str):
         cards, bid = raw_hand.split(" ")
-        self.cards_rank = {
-            "A": 13,
-            "K": 12,
-            "Q": 11,
-            "J": 10,
-            "T": 9,
-            "9": 8,
-            "8": 7,
-            "7": 6,
-            "6": 5,
-            "5": 4,
-            "4": 3,
-            "3": 2,
-            "2": 1,
-        }
-        self.raw_cards: str = cards
         self.bid: int = int(bid)
-        self.cards = cards
+        self.cards: str = cards
         self.label: HandLabel = self.assign_label(cards)
+        self.key: int = self.encode(cards, self.label)
+
+    @property
+    def raw_cards(self) -> str:
+        return self.cards
+
+    @classmethod
+    def encode(cls, cards: str, label: HandLabel) -> int:
+        # Label in the high bits, then one base-16 digit per card rank
+        key = label.value
+        for card in cards:
+            key = key << 4 | cls.cards_rank[card]
+        return key
+
+    @classmethod
+    def label_for(cls, counts: Counter) -> HandLabel:
+        return classify(counts.values())
+
+    @classmethod
+    def key_for(cls, cards: str, counts: Counter) -> int:
+        # Sort key straight from the cards and their counts, without building a hand
+        return cls.encode(cards, cls.label_for(counts))
 
     def __lt__(self, other):
-        if self.label.value == other.label.value:
-            for i in range(len(self.cards)):
-                self_card = self.cards[i]
-                other_card = other.cards[i]
-                if self.cards_rank[self_card] != self.cards_rank[other_card]:
-                    return self.cards_rank[self_card] < self.cards_rank[other_card]
-        else:
-            return self.label.value < other.label.value
+        return self.key < other.key
 
     def assign_label(self, raw_hand: str) -> HandLabel:
-        counts = Counter(raw_hand)
-        if self.is_five_of_a_kind(counts):
-            return HandLabel.FIVE_OF_A_KIND
-        elif self.is_four_of_a_kind(counts):
-            return HandLabel.FOUR_OF_A_KIND
-        elif self.is_full_house(counts):
-            return HandLabel.FULL_HOUSE
-        elif self.is_three_of_a_kind(counts):
-            return HandLabel.THREE_OF_A_KIND
-        elif self.is_two_pair(counts):
-            return HandLabel.TWO_PAIR
-        elif self.is_one_pair(counts):
-            return HandLabel.ONE_PAIR
-        elif self.is_high_card(counts):
-            return HandLabel.HIGH_CARD
-
-    def is_five_of_a_kind(self, counts) -> bool:
-        common = counts.most_common(2)
-        if len(common) == 1 and common[0][1] == 5:
-            return True
-        return False
-
-    def is_four_of_a_kind(self, counts) -> bool:
-        common = counts.most_common(5)
-        if len(common) == 2 and common[0][1] == 4:
-            return True
-        return False
-
-    def is_full_house(self, counts) -> bool:
-        common = counts.most_common(5)
-        if len(common) == 2 and common[0][1] == 3 and common[1][1] == 2:
-            return True
-        return False
-
-    def is_three_of_a_kind(self, counts) -> bool:
-        common = counts.most_common(5)
-        if len(common) == 3 and common[0][1] == 3:
-            return True
-        return False
-
-    def is_two_pair(self, counts) -> bool:
-        common = counts.most_common(5)
-        if len(common) == 3 and common[0][1] == 2 and common[1][1] == 2:
-            return True
-        return False
-
-    def is_one_pair(self, counts) -> bool:
-        common = counts.most_common(5)
-        if len(common) == 4 and common[0][1] == 2:
-            return True
-        return False
-
-    def is_high_card(self, counts) -> bool:
-        common = counts.most_common(5)
-        if len(common) == 5:
-            return True
-        return False
+        return self.label_for(Counter(raw_hand))
 
 
 class HandWithJoker(Hand):
-    def __init__(self, raw_hand: str):
-        super().__init__(raw_hand)
-        self.cards_rank = {
-            "A": 13,
-            "K": 12,
-            "Q": 11,
-            "T": 10,
-            "9": 9,
-            "8": 8,
-            "7": 7,
-            "6": 6,
-            "5": 5,
-            "4": 4,
-            "3": 3,
-            "2": 2,
-            "J": 1,
-        }
-        self.label: HandLabel = self.assign_label(self.cards)
-
-    def assign_label(self, raw_hand: str) -> HandLabel:
-        if raw_hand == "JJJJJ":
-            return HandLabel.FIVE_OF_A_KIND
-        counts = Counter(raw_hand.replace("J", ""))
-        most_common = counts.most_common(2)
-        # if the two first most commons have same count, then we replace the smallest card
-        if len(most_common) >= 2 and most_common[0][1] == most_common[1][1]:
-            card1 = most_common[0][0]
-            card2 = most_common[1][0]
-            if self.cards_rank[card1] > self.cards_rank[card2]:
-                replaced_hand = raw_hand.replace("J", card1)
-            else:
-                replaced_hand = raw_hand.replace("J", card2)
-        else:
-            card, _ = most_common[0]
-            replaced_hand = raw_hand.replace("J", card)
-        return super().assign_label(replaced_hand)
+    __slots__ = ()
+
+    cards_rank = {
+        "A": 13,
+        "K": 12,
+        "Q": 11,
+        "T": 10,
+        "9": 9,
+        "8": 8,
+        "7": 7,
+        "6": 6,
+        "5": 5,
+        "4": 4,
+        "3": 3,
+        "2": 2,
+        "J": 1,
+    }
+
+    @classmethod
+    def label_for(cls, counts: Counter) -> HandLabel:
+        return classify((count for card, count in counts.items() if card != "J"), counts["J"])
+
+
+def evaluate_rulesets(filename, rulesets: List[Type[Hand]]) -> List[int]:
+    # Read and count each hand once, then key it under every ruleset
+    keyed_bids = [[] for _ in rulesets]
+    for line in utils.read_by_line(filename):
+        cards, raw_bid = line.split(" ")
+        bid = int(raw_bid)
+        counts = Counter(cards)
+        for ruleset, keys in zip(rulesets, keyed_bids):
+            keys.append((ruleset.key_for(cards, counts), bid))
+    return [total_winnings(keys) for keys in keyed_bids]
 
 
 def solution(filename):
-    camel = CamelCards(filename, with_jokers=False)
-    print(camel.compute_total_winnings())
-
-    camel_jokers = CamelCards(filename, with_jokers=True)
-    print(camel_jokers.compute_total_winnings())
+    winnings, winnings_with_jokers = evaluate_rulesets(filename, [Hand, HandWithJoker])
+    print(winnings)
+    print(winnings_with_jokers)
 
 
 def test_samples():
@@ -190,6 +191,16 @@ def test_samples():
     assert CamelCards("src/2023_07_camel_cards.txt", with_jokers=False).compute_total_winnings() == 251029473
 
     assert Hand("32T3K 0") < Hand("T55J5 0")
+    assert not Hand("32T3K 0") < Hand("32T3K 1")
+    assert not hasattr(HandWithJoker("32T3K 0"), "__dict__")
+    assert Hand("KK677 0").key == 0x3CC566
+    assert HandWithJoker("KTJJT 0").label == HandLabel.FOUR_OF_A_KIND
+    assert HandWithJoker.key_for("KTJJT", Counter("KTJJT")) == HandWithJoker("KTJJT 0").key
+    assert evaluate_rulesets("src/2023_07_camel_cards_sample.txt", [Hand, HandWithJoker]) == [6440, 5905]
+    assert HandWithJoker("JJJJJ 0").label == HandLabel.FIVE_OF_A_KIND
+    assert HandWithJoker("2345J 0").label == HandLabel.ONE_PAIR
+    assert len(LABEL_TABLE) == 7 + 5 + 3 + 2 + 1 + 1
+    assert CamelCards("src/2023_07_camel_cards_sample.txt", with_jokers=True).compute_total_winnings() == 5905
 
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 import math
-from collections import deque
-from dataclasses import dataclass
+from array import array
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
 
 import utils
 
@@ -20,19 +21,153 @@ class Node:
             raise ValueError("Direction must be 0 or 1")
 
 
+@dataclass
+class GhostCycle:
+    # A ghost's walk over (node, instruction index) states: it runs tail_length
+    # steps before entering a loop of cycle_length steps
+    tail_length: int
+    cycle_length: int
+    tail_hits: List[int] = field(default_factory=list)
+    cycle_hits: List[int] = field(default_factory=list)
+
+    def is_hit(self, step: int) -> bool:
+        if step < self.tail_length:
+            return step in self.tail_hits
+        phase = self.tail_length + (step - self.tail_length) % self.cycle_length
+        return phase in self.cycle_hits
+
+    def hits_before(self, limit: int) -> List[int]:
+        hits = [step for step in self.tail_hits if step < limit]
+        for hit in self.cycle_hits:
+            hits.extend(range(hit, limit, self.cycle_length))
+        return sorted(hits)
+
+
+def crt(r1: int, m1: int, r2: int, m2: int) -> Tuple[int, int] | None:
+    # Generalized CRT: solve t = r1 (mod m1), t = r2 (mod m2) for non-coprime moduli
+    g = math.gcd(m1, m2)
+    if (r2 - r1) % g != 0:
+        return None
+    modulus = m1 // g * m2
+    k = (r2 - r1) // g * pow(m1 // g, -1, m2 // g) % (m2 // g)
+    return (r1 + m1 * k) % modulus, modulus
+
+
+def first_common_hit(cycles: List[GhostCycle]) -> int | None:
+    # Until every ghost has left its tail, check the first ghost's hits directly
+    settled = max(cycle.tail_length for cycle in cycles)
+    for step in cycles[0].hits_before(settled):
+        if step >= 1 and all(cycle.is_hit(step) for cycle in cycles):
+            return step
+
+    # Afterwards every ghost is periodic, so combine the cycle residues with CRT
+    residues, modulus = {0}, 1
+    for cycle in cycles:
+        combined = set()
+        for residue in residues:
+            for hit in cycle.cycle_hits:
+                solution = crt(residue, modulus, hit % cycle.cycle_length, cycle.cycle_length)
+                if solution is not None:
+                    combined.add(solution[0])
+        if not combined:
+            return None
+        residues, modulus = combined, math.lcm(modulus, cycle.cycle_length)
+
+    start = max(settled, 1)
+    return min(residue + -(-(start - residue) // modulus) * modulus for residue in residues)
+
+
+class InstructionJumps:
+    def __init__(self, tables: List[array], is_end: bytearray):
+        # pass_end[v]: node reached from v after one full pass over the instructions
+        # first_end[v]: step (1-based) of the first end node hit during that pass, 0 if none
+        size = len(is_end)
+        current = list(range(size))
+        first_end = [0] * size
+        for step, table in enumerate(tables, 1):
+            current = [table[node] for node in current]
+            for origin, node in enumerate(current):
+                if is_end[node] and not first_end[origin]:
+                    first_end[origin] = step
+        self.tables = tables
+        self.is_end = is_end
+        self.pass_end = array("i", current)
+        self.first_end = array("i", first_end)
+
+        # jumps[k][v] / hits[k][v]: node after 2^k passes and whether an end node was hit on the way
+        # Enough levels to cover `size` passes, after which pass boundaries repeat; more are
+        # added on demand by position_after
+        self.jumps = [self.pass_end]
+        self.hits = [bytearray(step > 0 for step in first_end)]
+        for _ in range(max(size, 1).bit_length()):
+            self.add_level()
+
+    def add_level(self) -> None:
+        jump, hit = self.jumps[-1], self.hits[-1]
+        self.jumps.append(array("i", (jump[jump[node]] for node in range(len(jump)))))
+        self.hits.append(bytearray(hit[node] or hit[jump[node]] for node in range(len(jump))))
+
+    def position_after(self, origin: int, steps: int) -> int:
+        passes, remainder = divmod(steps, len(self.tables))
+        while passes >> len(self.jumps):
+            self.add_level()
+        current = origin
+        level = 0
+        while passes:
+            if passes & 1:
+                current = self.jumps[level][current]
+            passes >>= 1
+            level += 1
+        for table in self.tables[:remainder]:
+            current = table[current]
+        return current
+
+    def first_end_from(self, origin: int) -> int | None:
+        # Skip the largest number of whole passes that never hit an end node
+        current = origin
+        passes = 0
+        for level in range(len(self.jumps) - 1, -1, -1):
+            if not self.hits[level][current]:
+                current = self.jumps[level][current]
+                passes += 1 << level
+        if not self.first_end[current]:
+            return None
+        return passes * len(self.tables) + self.first_end[current]
+
+
 class HauntedMap:
     def __init__(self, filename):
-        self.graph = {}
+        # Nodes are compiled to integer ids: left/right hold successor ids and
+        # is_start/is_end flag the nodes ending in "A"/"Z"
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.left = array("i")
+        self.right = array("i")
+        self.is_start = bytearray()
+        self.is_end = bytearray()
         self.instructions = []
+        self._jumps: InstructionJumps | None = None
         self._read_map(filename)
 
     def _read_map(self, filename):
         lines = list(utils.read_by_line(filename))
         self.instructions = lines[0]
 
-        for line in lines[2:]:
-            node = self.parse_line(line)
-            self.graph[node.name] = node
+        nodes = [self.parse_line(line) for line in lines[2:]]
+        for node in nodes:
+            self.ids[node.name] = len(self.names)
+            self.names.append(node.name)
+        for node in nodes:
+            self.left.append(self.ids[node.left])
+            self.right.append(self.ids[node.right])
+            self.is_start.append(node.name.endswith("A"))
+            self.is_end.append(node.name.endswith("Z"))
+
+    @property
+    def graph(self) -> Dict[str, Node]:
+        return {
+            name: Node(name, self.names[self.left[i]], self.names[self.right[i]]) for i, name in enumerate(self.names)
+        }
 
     def parse_line(self, line) -> Node:
         name, neighbours = line.split("=")
@@ -55,40 +190,61 @@ class HauntedMap:
                 yield 1
             index += 1
 
+    def successor_tables(self) -> List[array]:
+        return [self.left if char == "L" else self.right for char in self.instructions]
+
+    def jumps(self) -> InstructionJumps:
+        if self._jumps is None:
+            self._jumps = InstructionJumps(self.successor_tables(), self.is_end)
+        return self._jumps
+
+    def position_after(self, origin: str, steps: int) -> str:
+        return self.names[self.jumps().position_after(self.ids[origin], steps)]
+
+    def first_end_from(self, origin: str) -> int | None:
+        return self.jumps().first_end_from(self.ids[origin])
+
     def traverse(self, origin: str, destination: str):
-        current = self.graph[origin]
+        current = self.ids[origin]
+        target = self.ids[destination]
+        tables = self.successor_tables()
         steps = 0
-        for direction in self.directions():
-            steps += 1
-            current = self.graph[current.move(direction)]
-            if current.name == destination:
-                return steps
-        return None
+        while True:
+            for table in tables:
+                steps += 1
+                current = table[current]
+                if current == target:
+                    return steps
+
+    def analyse_cycle(self, origin: str) -> GhostCycle:
+        # States are (node, instruction index), packed as node * len(instructions) + index
+        tables = self.successor_tables()
+        period = len(tables)
+        is_end = self.is_end
+        seen = {}
+        hits = []
+        current = self.ids[origin]
+        step = 0
+        state = current * period
+        while state not in seen:
+            seen[state] = step
+            if is_end[current]:
+                hits.append(step)
+            current = tables[step % period][current]
+            step += 1
+            state = current * period + step % period
+
+        tail_length = seen[state]
+        return GhostCycle(
+            tail_length=tail_length,
+            cycle_length=step - tail_length,
+            tail_hits=[hit for hit in hits if hit < tail_length],
+            cycle_hits=[hit for hit in hits if hit >= tail_length],
+        )
 
     def traverse_all_paths(self):
-        queue = deque()
-        next_queue = deque()
-        steps = {}
-        for node in self.graph.keys():
-            if node.endswith("A"):
-                queue.append((node, node))
-                steps[node] = 0
-
-        all_steps = 0
-        for direction in self.directions():
-            all_steps += 1
-            while queue:
-                origin, current_name = queue.popleft()
-                current = self.graph[current_name]
-                next = current.move(direction)
-                if next.endswith("Z"):
-                    steps[origin] = all_steps
-                else:
-                    next_queue.append((origin, next))
-            if not next_queue:
-                return math.lcm(*steps.values())
-            queue = deque(next_queue)
-            next_queue = deque()
+        cycles = [self.analyse_cycle(name) for i, name in enumerate(self.names) if self.is_start[i]]
+        return first_common_hit(cycles)
 
 
 def solution(filename):
@@ -102,12 +258,31 @@ def test_samples():
     map = HauntedMap("src/2023_08_haunted_wasteland_sample.txt")
 
     assert len(map.graph.keys()) == 7
+    assert map.graph["AAA"] == Node("AAA", "BBB", "CCC")
+    assert map.left[map.ids["AAA"]] == map.ids["BBB"]
     assert map.instructions == "RL"
     assert map.traverse("AAA", "ZZZ") == 2
 
-    assert HauntedMap("src/2023_08_haunted_wasteland_sample_2.txt").traverse("AAA", "ZZZ") == 6
+    assert map.position_after("AAA", 2) == "ZZZ"
+    assert map.first_end_from("AAA") == 2
+
+    map = HauntedMap("src/2023_08_haunted_wasteland_sample_2.txt")
+    assert map.traverse("AAA", "ZZZ") == 6
+    assert [map.position_after("AAA", steps) for steps in range(7)] == ["AAA", "BBB", "AAA", "BBB", "AAA", "BBB", "ZZZ"]
+    assert map.first_end_from("AAA") == 6
+    assert map.position_after("AAA", 100) == "ZZZ"
     assert HauntedMap("src/2023_08_haunted_wasteland_sample_3.txt").traverse_all_paths() == 6
 
+    # Ghosts with tails and several Z offsets, where the LCM of first hits is wrong
+    map = HauntedMap("src/2023_08_haunted_wasteland_sample_4.txt")
+    assert map.analyse_cycle("22A") == GhostCycle(tail_length=1, cycle_length=3, tail_hits=[], cycle_hits=[1])
+    assert map.traverse_all_paths() == 4
+    # Far past the levels built up front, on a two-node cycle
+    assert map.position_after("11A", 10**15) == "11Z"
+    assert map.position_after("11A", 10**15 + 1) == "11B"
+    assert crt(2, 4, 3, 6) is None
+    assert crt(1, 4, 3, 6) == (9, 12)
+
 
 if __name__ == "__main__":
     test_samples()
@@ -1,6 +1,18 @@
+from functools import cache
+from math import comb
+from typing import Tuple
+
 import utils
 
 
+@cache
+def extrapolation_weights(length: int) -> Tuple[int, ...]:
+    # Weights w such that sum(w[i] * seq[i]) is the next value of any sequence of this
+    # length whose differences reach zero: w[i] = (-1) ** (length - 1 - i) * C(length, i).
+    # Applied to the reversed sequence, the same weights give the value before the first.
+    return tuple((-1) ** (length - 1 - i) * comb(length, i) for i in range(length))
+
+
 class Sequence:
     def __init__(self, raw_line):
         self.sequence = [int(num.strip()) for num in raw_line.split(" ")]
@@ -20,18 +32,21 @@ class Sequence:
             return self.compute_diffs_recursive(partial, results)
 
     def predict_next_number(self):
-        diffs = self.compute_diffs_recursive(self.sequence, [self.sequence])
-        next_num = diffs[-1][-1]
-        for i in range(len(diffs) - 1, 0, -1):
-            next_num = next_num + diffs[i - 1][-1]
-        return next_num
+        weights = extrapolation_weights(len(self.sequence))
+        return sum(weight * num for weight, num in zip(weights, self.sequence))
 
     def predict_first_number(self):
+        weights = extrapolation_weights(len(self.sequence))
+        return sum(weight * num for weight, num in zip(weights, reversed(self.sequence)))
+
+    def predict_with_diffs(self):
+        # Difference-triangle version of both predictions, kept as a cross-check
         diffs = self.compute_diffs_recursive(self.sequence, [self.sequence])
-        next_num = diffs[-1][0]
+        next_num, first_num = diffs[-1][-1], diffs[-1][0]
         for i in range(len(diffs) - 1, 0, -1):
-            next_num = diffs[i - 1][0] - next_num
-        return next_num
+            next_num = next_num + diffs[i - 1][-1]
+            first_num = diffs[i - 1][0] - first_num
+        return next_num, first_num
 
 
 def solution(filename):
@@ -50,6 +65,13 @@ def test_samples():
     lines = list(utils.read_by_line("src/2023_09_mirage_maintenance_sample.txt"))
     assert Sequence(lines[0]).sequence == [0, 3, 6, 9, 12, 15]
     assert Sequence(lines[0]).predict_next_number() == 18
+    assert extrapolation_weights(3) == (1, -3, 3)
+    sequences = [Sequence(line) for line in lines]
+    assert [seq.predict_next_number() for seq in sequences] == [18, 28, 68]
+    assert [seq.predict_first_number() for seq in sequences] == [-3, 0, 5]
+    for line in utils.read_by_line("src/2023_09_mirage_maintenance.txt"):
+        seq = Sequence(line)
+        assert seq.predict_with_diffs() == (seq.predict_next_number(), seq.predict_first_number())
 
 
 if __name__ == "__main__":
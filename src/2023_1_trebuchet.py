@@ -1,44 +1,88 @@
-import utils
+import argparse
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Tuple
 
+import utils
 
-def first_number_in_string(text: str) -> str | None:
-    for char in text:
-        if char.isdigit():
-            return char
-    return None
+DIGIT_NAMES = {
+    "one": "1",
+    "two": "2",
+    "three": "3",
+    "four": "4",
+    "five": "5",
+    "six": "6",
+    "seven": "7",
+    "eight": "8",
+    "nine": "9",
+}
+DIGIT_PATTERN = "|".join([r"\d", *DIGIT_NAMES])
+# Leftmost match scans from the start; the greedy prefix backtracks from the end,
+# so the last (possibly overlapping) digit is found without reversing the string
+FIRST_DIGIT = re.compile(DIGIT_PATTERN)
+LAST_DIGIT = re.compile(f".*({DIGIT_PATTERN})")
+# Bytes read per task by the parallel mode
+CHUNK_SIZE = 64 * 1024 * 1024
 
 
-def replace_name_with_number(text: str) -> str:
-    values = {
-        "one": "o1e",
-        "two": "t2o",
-        "three": "t3e",
-        "four": "f4r",
-        "five": "f5e",
-        "six": "s6x",
-        "seven": "s7n",
-        "eight": "e8t",
-        "nine": "n9e",
-    }
-    for key, value in values.items():
-        text = text.replace(key, value)
-    return text
+def digit_value(token: str) -> str:
+    return DIGIT_NAMES.get(token, token)
 
 
 def first_and_last_number(text: str) -> int:
-    text = replace_name_with_number(text)
-    first_number = first_number_in_string(text)
-    last_number = first_number_in_string(text[::-1])
-    if first_number is None or last_number is None:
+    first_match = FIRST_DIGIT.search(text)
+    last_match = LAST_DIGIT.match(text)
+    if first_match is None or last_match is None:
         raise Exception(f"No number in string: {text}")
-    return int(first_number + last_number)
+    return int(digit_value(first_match.group()) + digit_value(last_match.group(1)))
+
+
+def sum_calibrations(lines: Iterable[str]) -> int:
+    # Blank lines (such as the one after a final newline) carry no calibration value
+    return sum(first_and_last_number(line) for line in lines if line)
+
+
+def chunk_boundaries(filename, chunk_size: int = CHUNK_SIZE) -> List[Tuple[int, int]]:
+    # Split the file into [start, end) byte ranges that always end right after a newline
+    size = os.path.getsize(filename)
+    boundaries = []
+    with open(filename, "rb") as f:
+        start = 0
+        while start < size:
+            f.seek(min(start + chunk_size, size))
+            f.readline()
+            end = min(f.tell(), size)
+            boundaries.append((start, end))
+            start = end
+    return boundaries
 
 
-def trebuchet(filename):
-    accumulator = 0
-    for calibration in utils.read_by_line(filename):
-        accumulator += first_and_last_number(calibration)
-    print(accumulator)
+def sum_calibration_chunk(filename, start: int, end: int) -> int:
+    with open(filename, "rb") as f:
+        f.seek(start)
+        chunk = f.read(end - start)
+    return sum_calibrations(chunk.decode().splitlines())
+
+
+def trebuchet_parallel(filename, workers: int | None = None, chunk_size: int = CHUNK_SIZE) -> int:
+    boundaries = chunk_boundaries(filename, chunk_size)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        partial_sums = executor.map(
+            sum_calibration_chunk,
+            [filename] * len(boundaries),
+            [start for start, _ in boundaries],
+            [end for _, end in boundaries],
+        )
+        return sum(partial_sums)
+
+
+def trebuchet(filename, workers: int | None = None, chunk_size: int = CHUNK_SIZE):
+    if workers:
+        print(trebuchet_parallel(filename, workers, chunk_size))
+        return
+    print(sum_calibrations(utils.read_by_line(filename)))
 
 
 def test_samples():
@@ -54,8 +98,27 @@ def test_samples():
     assert first_and_last_number("41nine") == 49
     assert first_and_last_number("twoxx") == 22
     assert first_and_last_number("ddgjgcrssevensix37twooneightgt ") == 78
+    assert first_and_last_number("eighthree") == 83
+    assert first_and_last_number("sevenine") == 79
+
+    boundaries = chunk_boundaries("src/2023_1_trebuchet.txt", chunk_size=1000)
+    assert boundaries[0][0] == 0 and boundaries[-1][1] == os.path.getsize("src/2023_1_trebuchet.txt")
+    assert all(end == next_start for (_, end), (next_start, _) in zip(boundaries, boundaries[1:]))
+    assert trebuchet_parallel("src/2023_1_trebuchet.txt", workers=2, chunk_size=1000) == 54530
+
+    # Both paths skip the empty line after a final newline
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "calibration.txt")
+        with open(filename, "w") as f:
+            f.write("1abc2\npqr3stu8vwx\ntwo1nine\n")
+        assert sum_calibrations(utils.read_by_line(filename)) == 12 + 38 + 29
+        assert trebuchet_parallel(filename, workers=2, chunk_size=4) == 12 + 38 + 29
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=None, help="sum newline-aligned chunks on N processes")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="bytes per chunk in the parallel mode")
+    args = parser.parse_args()
     test_samples()
-    trebuchet("src/2023_1_trebuchet.txt")
+    trebuchet("src/2023_1_trebuchet.txt", workers=args.workers, chunk_size=args.chunk_size)
@@ -1,8 +1,15 @@
-from dataclasses import dataclass
-from typing import List
+import re
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Tuple
+
+import numpy as np
 
 import utils
 
+CUBE_PATTERN = re.compile(r"(\d+) (red|green|blue)")
+
 
 @dataclass
 class GameSet:
@@ -72,6 +79,149 @@ def parse_game(line: str) -> Game:
     return Game(number=game_number, sets=game_sets)
 
 
+@dataclass
+class GameColumns:
+    # One entry per set in red/green/blue; the sets of game i are offsets[i]:offsets[i + 1]
+    numbers: array = field(default_factory=lambda: array("I"))
+    offsets: array = field(default_factory=lambda: array("I", [0]))
+    red: array = field(default_factory=lambda: array("I"))
+    green: array = field(default_factory=lambda: array("I"))
+    blue: array = field(default_factory=lambda: array("I"))
+
+    def append_line(self, line: str) -> None:
+        # Game 1: 3 blue, 4 red; 1 red, 2 green, 6 blue; 2 green
+        header, body = line.split(":")
+        self.numbers.append(int(header.split(" ")[1]))
+        for game_set in body.split(";"):
+            counts = {"red": 0, "green": 0, "blue": 0}
+            for count, color in CUBE_PATTERN.findall(game_set):
+                counts[color] = int(count)
+            self.red.append(counts["red"])
+            self.green.append(counts["green"])
+            self.blue.append(counts["blue"])
+        self.offsets.append(len(self.red))
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def max_per_color(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if len(self) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        starts = np.frombuffer(self.offsets, dtype=np.uint32)[:-1]
+        return tuple(
+            np.maximum.reduceat(np.frombuffer(column, dtype=np.uint32), starts).astype(np.int64)
+            for column in (self.red, self.green, self.blue)
+        )
+
+    def sum_valid_game_numbers(self, max_red: int, max_green: int, max_blue: int) -> int:
+        red, green, blue = self.max_per_color()
+        valid = (red <= max_red) & (green <= max_green) & (blue <= max_blue)
+        return int(np.frombuffer(self.numbers, dtype=np.uint32)[valid].astype(np.int64).sum())
+
+    def sum_game_power_set(self) -> int:
+        red, green, blue = self.max_per_color()
+        return int((red * green * blue).sum())
+
+    def game(self, index: int) -> Game:
+        start, end = self.offsets[index], self.offsets[index + 1]
+        sets = [GameSet(red=self.red[i], blue=self.blue[i], green=self.green[i]) for i in range(start, end)]
+        return Game(number=self.numbers[index], sets=sets)
+
+    def games(self) -> Iterator[Game]:
+        for index in range(len(self)):
+            yield self.game(index)
+
+
+def parse_columns(lines: Iterable[str]) -> GameColumns:
+    columns = GameColumns()
+    for line in lines:
+        if line:
+            columns.append_line(line)
+    return columns
+
+
+def game_maxima(line: str) -> Tuple[int, int, int, int]:
+    # (game number, max red, max green, max blue), folded straight from the draws
+    header, body = line.split(":")
+    maxima = {"red": 0, "green": 0, "blue": 0}
+    for count, color in CUBE_PATTERN.findall(body):
+        maxima[color] = max(maxima[color], int(count))
+    return int(header.split(" ")[1]), maxima["red"], maxima["green"], maxima["blue"]
+
+
+def stream_game_totals(lines: Iterable[str], limits: List[Tuple[int, int, int]]) -> Tuple[List[int], int]:
+    # One pass in constant memory: the valid game sum for every (red, green, blue)
+    # limit profile, plus the sum of power sets
+    valid_sums = [0] * len(limits)
+    power_sum = 0
+    for line in lines:
+        if not line:
+            continue
+        number, red, green, blue = game_maxima(line)
+        for i, (max_red, max_green, max_blue) in enumerate(limits):
+            if red <= max_red and green <= max_green and blue <= max_blue:
+                valid_sums[i] += number
+        power_sum += red * green * blue
+    return valid_sums, power_sum
+
+
+class BagIndex:
+    def __init__(self, maxima: Iterable[Tuple[int, int, int, int]]):
+        # maxima are (game number, max red, max green, max blue). sums[i, j, k] holds the total of
+        # the game numbers whose maxima are within the i-th red, j-th green and k-th blue distinct
+        # value. For id listings, cells[i][j] holds the (blue, number) pairs of the games whose red
+        # and green are exactly the i-th and j-th distinct values, sorted by blue.
+        self.games = list(maxima)
+        self.axes = [sorted({game[color] for game in self.games}) for color in (1, 2, 3)]
+        red_axis, green_axis, _ = self.axes
+        self.cells = [[[] for _ in green_axis] for _ in red_axis]
+        for number, red, green, blue in self.games:
+            self.cells[bisect_right(red_axis, red) - 1][bisect_right(green_axis, green) - 1].append((blue, number))
+        for row in self.cells:
+            for cell in row:
+                cell.sort()
+        self.sums = np.zeros([len(axis) for axis in self.axes], dtype=np.int64)
+        if self.games:
+            coordinates = tuple(
+                np.searchsorted(axis, [game[color] for game in self.games])
+                for color, axis in zip((1, 2, 3), self.axes)
+            )
+            np.add.at(self.sums, coordinates, [game[0] for game in self.games])
+            for dimension in range(3):
+                np.cumsum(self.sums, axis=dimension, out=self.sums)
+
+    @staticmethod
+    def from_columns(columns: GameColumns) -> "BagIndex":
+        red, green, blue = columns.max_per_color()
+        return BagIndex(zip(columns.numbers, red.tolist(), green.tolist(), blue.tolist()))
+
+    def sum_valid_game_numbers(self, max_red: int, max_green: int, max_blue: int) -> int:
+        position = [bisect_right(axis, limit) - 1 for axis, limit in zip(self.axes, (max_red, max_green, max_blue))]
+        if min(position, default=-1) < 0:
+            return 0
+        return int(self.sums[tuple(position)])
+
+    def valid_game_numbers(self, max_red: int, max_green: int, max_blue: int) -> List[int]:
+        # Only the cells within the red and green limits are visited, and each contributes a
+        # blue prefix, so the work tracks the matching games rather than all of them
+        red_axis, green_axis, _ = self.axes
+        numbers = []
+        for row in self.cells[: bisect_right(red_axis, max_red)]:
+            for cell in row[: bisect_right(green_axis, max_green)]:
+                numbers.extend(number for _, number in cell[: bisect_right(cell, (max_blue, float("inf")))])
+        return sorted(numbers)
+
+    def query(self, max_red: int, max_green: int, max_blue: int) -> Tuple[int, List[int]]:
+        return (
+            self.sum_valid_game_numbers(max_red, max_green, max_blue),
+            self.valid_game_numbers(max_red, max_green, max_blue),
+        )
+
+    def query_many(self, bags: Iterable[Tuple[int, int, int]]) -> List[Tuple[int, List[int]]]:
+        return [self.query(*bag) for bag in bags]
+
+
 def sum_valid_game_numbers(
     games: List[Game], max_red: int, max_green: int, max_blue: int
 ) -> int:
@@ -84,16 +234,20 @@ def sum_game_power_set(games: List[Game]) -> int:
     return sum([game.power_set() for game in games])
 
 
-def cube_conundrum(filename):
+def cube_conundrum(filename, streaming=False):
     MAX_RED = 12
     MAX_GREEN = 13
     MAX_BLUE = 14
-    games = []
-    for line in utils.read_by_line(filename):
-        games.append(parse_game(line))
+    if streaming:
+        valid_sums, power_sum = stream_game_totals(utils.read_by_line(filename), [(MAX_RED, MAX_GREEN, MAX_BLUE)])
+        print(valid_sums[0])
+        print(power_sum)
+        return
+
+    columns = parse_columns(utils.read_by_line(filename))
 
-    print(sum_valid_game_numbers(games, MAX_RED, MAX_GREEN, MAX_BLUE))
-    print(sum_game_power_set(games))
+    print(columns.sum_valid_game_numbers(MAX_RED, MAX_GREEN, MAX_BLUE))
+    print(columns.sum_game_power_set())
 
 
 def test_samples():
@@ -111,6 +265,24 @@ def test_samples():
         ],
     )
 
+    lines = list(utils.read_by_line("src/2023_2_cube_conundrum_sample.txt"))
+    games = [parse_game(line) for line in lines]
+    columns = parse_columns(lines)
+    assert list(columns.games()) == games
+    assert columns.sum_valid_game_numbers(12, 13, 14) == sum_valid_game_numbers(games, 12, 13, 14) == 8
+    assert columns.sum_game_power_set() == sum_game_power_set(games) == 2286
+
+    assert game_maxima(lines[0]) == (1, 4, 2, 6)
+    assert stream_game_totals(lines, [(12, 13, 14), (20, 13, 14), (0, 0, 0)]) == ([8, 11, 0], 2286)
+
+    index = BagIndex.from_columns(columns)
+    assert index.query(12, 13, 14) == (8, [1, 2, 5])
+    assert index.query_many([(20, 13, 14), (0, 0, 0), (100, 100, 100)]) == [
+        (11, [1, 2, 3, 5]),
+        (0, []),
+        (15, [1, 2, 3, 4, 5]),
+    ]
+
 
 if __name__ == "__main__":
     test_samples()
@@ -1,5 +1,11 @@
+import os
+import re
+import tempfile
 from dataclasses import dataclass
-from typing import List, Tuple
+from itertools import chain
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
 
 import utils
 
@@ -90,11 +96,16 @@ class Matrix:
         return char == "*"
 
     def node_adjacents(self, node: NumberNode) -> List[Coordinate]:
-        node_adjacents = set()
-        for coord in node.coordinates():
-            node_adjacents = node_adjacents.union(set(self.adjacent8_coordinates(coord)))
-
-        return list(node_adjacents)
+        # Bounding box around the number, minus the number itself
+        adjacents = []
+        for line in range(node.line_number - 1, node.line_number + 2):
+            for column in range(node.col_start - 1, node.col_end + 1):
+                if line == node.line_number and node.col_start <= column < node.col_end:
+                    continue
+                coord = Coordinate(line, column)
+                if self.valid_coordinates(coord):
+                    adjacents.append(coord)
+        return adjacents
 
     def is_part_number(self, node: NumberNode) -> bool:
         for coord in self.node_adjacents(node):
@@ -104,23 +115,160 @@ class Matrix:
         return False
 
     def sum_part_numbers(self) -> int:
-        return sum([node.number for node in self.nodes if self.is_part_number(node)])
+        part_numbers, _ = scan_schematic(self.matrix)
+        return part_numbers
 
     def compute_gear_adjacents(self) -> None:
+        width = self.num_colmns()
+        gears_by_position = {}
         for gear in self.gears:
             gear.adjacent_numbers = []
+            gears_by_position[gear.line * width + gear.column] = gear
 
         for node in self.nodes:
             for coord in self.node_adjacents(node):
-                if self.is_adjacent_to_gear(coord):
-                    gear = self.gear_by_coord(coord)
-                    if gear:
-                        gear.adjacent_numbers.append(node)
+                gear = gears_by_position.get(coord.line * width + coord.column)
+                if gear:
+                    gear.adjacent_numbers.append(node)
         return
 
     def sum_of_gear_ratios(self) -> int:
-        self.compute_gear_adjacents()
-        return sum([gear.gear_ratio() for gear in self.gears])
+        _, gear_ratios = scan_schematic(self.matrix)
+        return gear_ratios
+
+
+@dataclass
+class NumpyMatrix:
+    # uint8 grid with a one-cell border of "." so 3x3 neighbourhoods never wrap
+    grid: np.ndarray
+
+    @staticmethod
+    def from_lines(matrix: List[str]) -> "NumpyMatrix":
+        width = max((len(line) for line in matrix), default=0)
+        padded = ["." * (width + 2)] + ["." + line.ljust(width, ".") + "." for line in matrix] + ["." * (width + 2)]
+        data = "".join(padded).encode()
+        return NumpyMatrix(np.frombuffer(data, dtype=np.uint8).reshape(len(padded), width + 2))
+
+    def digits(self) -> np.ndarray:
+        return (self.grid >= ord("0")) & (self.grid <= ord("9"))
+
+    def symbols(self) -> np.ndarray:
+        return ~self.digits() & (self.grid != ord("."))
+
+    @staticmethod
+    def neighbourhood(mask: np.ndarray) -> List[np.ndarray]:
+        # The 3x3 window around every interior cell, as nine shifted views
+        height, width = mask.shape
+        return [
+            mask[line : height - 2 + line, column : width - 2 + column] for line in range(3) for column in range(3)
+        ]
+
+    def dilate(self, mask: np.ndarray) -> np.ndarray:
+        out = np.zeros_like(mask)
+        out[1:-1, 1:-1] = np.logical_or.reduce(self.neighbourhood(mask))
+        return out
+
+    def numbers(self) -> Tuple[np.ndarray, np.ndarray]:
+        # Label every digit with its number id (1-based, 0 elsewhere) and compute each number's value.
+        # The border column guarantees runs never continue onto the next line.
+        digits = self.digits().ravel()
+        previous = np.concatenate(([False], digits[:-1]))
+        following = np.concatenate((digits[1:], [False]))
+        labels = np.cumsum(digits & ~previous) * digits
+        ends = np.flatnonzero(digits & ~following)
+        positions = np.flatnonzero(digits)
+        place = ends[labels[positions] - 1] - positions
+        values = np.zeros(len(ends), dtype=np.int64)
+        np.add.at(values, labels[positions] - 1, (self.grid.ravel()[positions] - ord("0")) * 10 ** place)
+        return labels.reshape(self.grid.shape), values
+
+    def sum_part_numbers(self) -> int:
+        labels, values = self.numbers()
+        near_symbol = self.dilate(self.symbols())
+        is_part = np.zeros(len(values) + 1, dtype=bool)
+        np.logical_or.at(is_part, labels[near_symbol], True)
+        return int(values[is_part[1:]].sum())
+
+    def sum_of_gear_ratios(self, gear_character="*") -> int:
+        labels, values = self.numbers()
+        gear_cells = self.grid[1:-1, 1:-1] == ord(gear_character)
+        # (gears, 9) table of the number ids around each gear, deduplicated per row
+        around = np.sort(np.stack([window[gear_cells] for window in self.neighbourhood(labels)], axis=1), axis=1)
+        distinct = (around != 0) & (np.diff(around, axis=1, prepend=0) != 0)
+        counts = distinct.sum(axis=1)
+        ratios = np.where(distinct, np.concatenate(([0], values))[around], 1).prod(axis=1)
+        return int(ratios[counts == 2].sum())
+
+
+def scan_schematic(matrix: List[str], gear_character="*") -> Tuple[int, int]:
+    # Single sweep: each number inspects its bounding box once, and the numbers
+    # touching a gear are collected under the gear's line * width + column
+    width = max((len(text) for text in matrix), default=0)
+    part_numbers = 0
+    gears: Dict[int, List[int]] = {}
+    for line_number, text in enumerate(matrix):
+        for match in re.finditer(r"\d+", text):
+            number = int(match.group())
+            is_part = False
+            for line in range(max(line_number - 1, 0), min(line_number + 2, len(matrix))):
+                row = matrix[line]
+                for column in range(max(match.start() - 1, 0), min(match.end() + 1, len(row))):
+                    char = row[column]
+                    if char.isdigit() or char == ".":
+                        continue
+                    is_part = True
+                    if char == gear_character:
+                        gears.setdefault(line * width + column, []).append(number)
+            if is_part:
+                part_numbers += number
+
+    gear_ratios = sum(numbers[0] * numbers[1] for numbers in gears.values() if len(numbers) == 2)
+    return part_numbers, gear_ratios
+
+
+def stream_schematic(filename, gear_character="*") -> Iterator[Tuple[str, int]]:
+    # Rolling three-row window over the memory-mapped file. Numbers on a row are
+    # resolved once the row below it is read, and gears once the numbers below them are
+    gear = ord(gear_character)
+    not_symbols = frozenset(b"0123456789.")
+    gears: Dict[Tuple[int, int], List[int]] = {}
+    lines = chain(utils.read_by_line_mmap(filename), [b""])
+    above, row = b"", next(lines)
+    for row_number, below in enumerate(lines):
+        for match in re.finditer(rb"\d+", row):
+            number = int(match.group())
+            is_part = False
+            for line, neighbour in ((row_number - 1, above), (row_number, row), (row_number + 1, below)):
+                for column in range(max(match.start() - 1, 0), min(match.end() + 1, len(neighbour))):
+                    char = neighbour[column]
+                    if char in not_symbols:
+                        continue
+                    is_part = True
+                    if char == gear:
+                        gears.setdefault((line, column), []).append(number)
+            if is_part:
+                yield "part", number
+
+        # Gears on the row above have now seen every neighbouring number
+        for key in [key for key in gears if key[0] < row_number]:
+            numbers = gears.pop(key)
+            if len(numbers) == 2:
+                yield "gear", numbers[0] * numbers[1]
+        above, row = row, below
+
+    for numbers in gears.values():
+        if len(numbers) == 2:
+            yield "gear", numbers[0] * numbers[1]
+
+
+def sum_schematic_stream(filename) -> Tuple[int, int]:
+    part_numbers, gear_ratios = 0, 0
+    for kind, value in stream_schematic(filename):
+        if kind == "part":
+            part_numbers += value
+        else:
+            gear_ratios += value
+    return part_numbers, gear_ratios
 
 
 def create_node(line_text: str, line_number: int, col_start: int, col_end: int) -> NumberNode:
@@ -163,18 +311,24 @@ def parse_line(matrix: List[str], line_number: int, gear_character="*") -> List[
     return number_nodes, gear_nodes
 
 
-def gear_ratios(filename):
-    matrix = utils.read_input(filename).split("\n")
+def build_matrix(matrix: List[str]) -> Matrix:
     nodes = []
     gears = []
     for line_number, _ in enumerate(matrix):
         number_nodes, gear_nodes = parse_line(matrix, line_number)
         nodes.extend(number_nodes)
         gears.extend(gear_nodes)
+    return Matrix(matrix, nodes, gears)
 
-    matrix = Matrix(matrix, nodes, gears)
-    print(matrix.sum_part_numbers())
-    print(matrix.sum_of_gear_ratios())
+
+def gear_ratios(filename, streaming=False):
+    if streaming:
+        part_numbers, gear_ratios = sum_schematic_stream(filename)
+    else:
+        matrix = list(utils.read_by_line(filename))
+        part_numbers, gear_ratios = scan_schematic(matrix)
+    print(part_numbers)
+    print(gear_ratios)
 
 
 def test_samples():
@@ -222,6 +376,21 @@ def test_samples():
         )
     ]
 
+    assert scan_schematic(matrix) == (4361, 467835)
+    assert sum_schematic_stream("src/2023_3_gear_ratios_sample.txt") == (4361, 467835)
+    with tempfile.TemporaryDirectory() as directory:
+        crlf = os.path.join(directory, "crlf.txt")
+        with open(crlf, "wb") as f:
+            f.write(b"..12\r\n....\r\n")
+        assert sum_schematic_stream(crlf) == scan_schematic(list(utils.read_by_line(crlf))) == (0, 0)
+    sample = build_matrix(matrix)
+    assert sample.sum_part_numbers() == 4361
+    assert sample.sum_of_gear_ratios() == 467835
+    sample.compute_gear_adjacents()
+    assert NumpyMatrix.from_lines(matrix).sum_part_numbers() == 4361
+    assert NumpyMatrix.from_lines(matrix).sum_of_gear_ratios() == 467835
+    assert [node.number for node in sample.gears[0].adjacent_numbers] == [467, 35]
+
 
 if __name__ == "__main__":
     test_samples()
@@ -1,14 +1,27 @@
-from dataclasses import dataclass
-from typing import List, Tuple
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Iterable, List, Tuple
 
 import utils
 
 
+def to_bitmask(numbers: Iterable[int]) -> int:
+    # Card numbers are small non-negative integers, so bit n stands for number n
+    mask = 0
+    for number in numbers:
+        mask |= 1 << number
+    return mask
+
+
 @dataclass
 class Card:
     number: int
     winning: List[int]
     scratch: List[int]
+    matches: int = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.matches = (to_bitmask(self.winning) & to_bitmask(self.scratch)).bit_count()
 
 
 def parse_card_number(line: str) -> int:
@@ -38,33 +51,40 @@ def parse_card(line: str) -> Card:
 
 
 def card_score(card: Card) -> int:
-    scores = set(card.winning).intersection(set(card.scratch))
-    if len(scores) == 0:
-        score = 0
-    else:
-        score = 2 ** (len(scores) - 1)
-    return score
+    if card.matches == 0:
+        return 0
+    return 1 << (card.matches - 1)
 
 
 def number_of_winning_numbers(card: Card) -> int:
-    return len(set(card.winning).intersection(set(card.scratch)))
+    return card.matches
 
 
 def sum_winning_scores(cards: List[Card]) -> int:
     return sum(card_score(card) for card in cards)
 
 
-def sum_part_2(cards: List[Card]) -> int:
-    total_scratch_cards = {}
+def count_scratch_cards(cards: Iterable[Card]) -> int:
+    # Difference array over a sliding window of the cards ahead: pending[k] is the change in
+    # extra copies k + 1 cards from now, so each card does one range-add. Cards must arrive in order.
+    pending = deque()
+    extra_copies = 0
+    total = 0
     for card in cards:
-        total_scratch_cards[card.number] = 1
+        if pending:
+            extra_copies += pending.popleft()
+        copies = 1 + extra_copies
+        total += copies
+        if card.matches:
+            while len(pending) <= card.matches:
+                pending.append(0)
+            pending[0] += copies
+            pending[card.matches] -= copies
+    return total
 
-    for card in cards:
-        winning_numbers = number_of_winning_numbers(card)
-        for i in range(card.number + 1, card.number + winning_numbers + 1):
-            total_scratch_cards[i] += total_scratch_cards[card.number]
 
-    return sum(total_scratch_cards.values())
+def sum_part_2(cards: List[Card]) -> int:
+    return count_scratch_cards(cards)
 
 
 def scratchcards(filename):
@@ -79,6 +99,12 @@ def test_samples():
     assert parse_card("Card 1: 41 48 83 86 17 | 83 86  6 31 17  9 48 53") == Card(
         1, winning=[41, 48, 83, 86, 17], scratch=[83, 86, 6, 31, 17, 9, 48, 53]
     )
+    cards = [parse_card(line) for line in utils.read_by_line("src/2023_4_scratchcards_sample.txt")]
+    assert [card.matches for card in cards] == [4, 2, 2, 1, 0, 0]
+    assert sum_winning_scores(cards) == 13
+    assert sum_part_2(cards) == 30
+    lines = utils.read_by_line("src/2023_4_scratchcards_sample.txt")
+    assert count_scratch_cards(parse_card(line) for line in lines) == 30
 
 
 if __name__ == "__main__":
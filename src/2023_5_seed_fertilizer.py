@@ -1,11 +1,21 @@
+import argparse
+from array import array
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from enum import Enum
-from functools import cache, partial
-from typing import Callable, Dict, List, Tuple
+from functools import cache
+from typing import Iterator, List, Tuple
 
+import numpy as np
 from tqdm import tqdm
 
 import utils
 
+# Upper bound of the seed domain used when composing the layers
+MAX_VALUE = 2**62
+# Number of seeds evaluated at once by the vectorized path
+CHUNK_SIZE = 1 << 20
+
 
 class Mappings(Enum):
     seeds = "seeds:"
@@ -18,17 +28,75 @@ class Mappings(Enum):
     humidity_to_location = "humidity-to-location map:"
 
 
+class MappingTable:
+    def __init__(self, rules: List[Tuple[int, int, int]]):
+        # Rules are (dest_start, source_start, length), stored sorted by source start
+        self.starts = array("q")
+        self.lengths = array("q")
+        self.offsets = array("q")
+        for dest_start, source_start, length in sorted(rules, key=lambda rule: rule[1]):
+            self.starts.append(source_start)
+            self.lengths.append(length)
+            self.offsets.append(dest_start - source_start)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def split(self, start: int, end: int) -> Iterator[Tuple[int, int, int]]:
+        # Cut [start, end) at rule boundaries, yielding (start, end, offset) pieces
+        i = max(bisect_right(self.starts, start) - 1, 0)
+        while start < end and i < len(self.starts):
+            source_start = self.starts[i]
+            source_end = source_start + self.lengths[i]
+            if source_end <= start:
+                i += 1
+                continue
+            if source_start >= end:
+                break
+            # Gap before the rule maps to itself
+            if start < source_start:
+                yield start, source_start, 0
+                start = source_start
+            stop = min(end, source_end)
+            yield start, stop, self.offsets[i]
+            start = stop
+            i += 1
+        if start < end:
+            yield start, end, 0
+
+    def min_over(self, start: int, end: int) -> int:
+        # Each piece is increasing, so its minimum is at its left edge
+        return min(piece_start + offset for piece_start, _, offset in self.split(start, end))
+
+    def lookup(self, value: int) -> int:
+        i = bisect_right(self.starts, value) - 1
+        if i >= 0 and value < self.starts[i] + self.lengths[i]:
+            return value + self.offsets[i]
+        return value
+
+    def lookup_many(self, values: np.ndarray) -> np.ndarray:
+        if len(self.starts) == 0:
+            return values.copy()
+        starts = np.frombuffer(self.starts, dtype=np.int64)
+        lengths = np.frombuffer(self.lengths, dtype=np.int64)
+        offsets = np.frombuffer(self.offsets, dtype=np.int64)
+        i = np.searchsorted(starts, values, side="right") - 1
+        clipped = np.maximum(i, 0)
+        hit = (i >= 0) & (values < starts[clipped] + lengths[clipped])
+        return values + np.where(hit, offsets[clipped], 0)
+
+
 class Almanac:
     def __init__(
         self,
         seeds: List[int],
-        seed_to_soil: List[Callable],
-        soil_to_fertilizer: List[Callable],
-        fertilizer_to_water: List[Callable],
-        water_to_light: List[Callable],
-        light_to_temperature: List[Callable],
-        temperature_to_humidity: List[Callable],
-        humidity_to_location: List[Callable],
+        seed_to_soil: MappingTable,
+        soil_to_fertilizer: MappingTable,
+        fertilizer_to_water: MappingTable,
+        water_to_light: MappingTable,
+        light_to_temperature: MappingTable,
+        temperature_to_humidity: MappingTable,
+        humidity_to_location: MappingTable,
     ):
         self.seeds = seeds
         self.seed_to_soil = seed_to_soil
@@ -38,6 +106,7 @@ class Almanac:
         self.light_to_temperature = light_to_temperature
         self.temperature_to_humidity = temperature_to_humidity
         self.humidity_to_location = humidity_to_location
+        self.compiled: MappingTable | None = None
 
     @staticmethod
     def find_relevant_lines(lines, section: Mappings) -> Tuple[int, int]:
@@ -58,21 +127,14 @@ class Almanac:
         return start, end
 
     @staticmethod
-    def parse_correlation(all_lines: List[str], section: Mappings) -> Dict[int, int]:
+    def parse_correlation(all_lines: List[str], section: Mappings) -> MappingTable:
         start, end = Almanac.find_relevant_lines(all_lines, section)
         lines = all_lines[start:end]
-        out = []
+        rules = []
         for line in lines:
-            raw_dest_start, raw_source_start, raw_length = Almanac.parse_number_line(line)
-
-            def get_value(dest_start, source_start, length, value: int) -> int:
-                offset = source_start - dest_start
-                if source_start <= value < source_start + length:
-                    return value - offset
-                return None
-
-            out.append(partial(get_value, raw_dest_start, raw_source_start, raw_length))
-        return out
+            dest_start, source_start, length = Almanac.parse_number_line(line)
+            rules.append((dest_start, source_start, length))
+        return MappingTable(rules)
 
     @staticmethod
     def parse_number_line(line: str) -> List[int]:
@@ -98,13 +160,12 @@ class Almanac:
             humidity_to_location=Almanac.parse_correlation(lines, Mappings.humidity_to_location),
         )
 
-    def find_applicable_rule(self, value: int, predicates) -> int:
-        for predicate in predicates:
-            if predicate(value) is not None:
-                return predicate(value)
-        return value
+    def find_applicable_rule(self, value: int, table: MappingTable) -> int:
+        return table.lookup(value)
 
     def find_location(self, seed: int) -> int:
+        if self.compiled is not None:
+            return self.compiled.lookup(seed)
         soil = self.find_applicable_rule(seed, self.seed_to_soil)
         fertilizer = self.find_applicable_rule(soil, self.soil_to_fertilizer)
         water = self.find_applicable_rule(fertilizer, self.fertilizer_to_water)
@@ -114,24 +175,164 @@ class Almanac:
         location = self.find_applicable_rule(humidity, self.humidity_to_location)
         return location
 
+    def find_locations(self, seeds: np.ndarray) -> np.ndarray:
+        values = np.asarray(seeds, dtype=np.int64)
+        if self.compiled is not None:
+            return self.compiled.lookup_many(values)
+        for layer in self.layers():
+            values = layer.lookup_many(values)
+        return values
+
     def find_lowest_location(self) -> int:
         return min(self.find_location(seed) for seed in self.seeds)
 
-    def find_lowest_location_seed_range(self) -> int:
+    def layers(self) -> List[MappingTable]:
+        return [
+            self.seed_to_soil,
+            self.soil_to_fertilizer,
+            self.fertilizer_to_water,
+            self.water_to_light,
+            self.light_to_temperature,
+            self.temperature_to_humidity,
+            self.humidity_to_location,
+        ]
+
+    def seed_ranges(self) -> List[Tuple[int, int]]:
+        # Seeds come in (start, length) pairs, returned as [start, end) intervals
+        return [(start, start + length) for start, length in zip(self.seeds[::2], self.seeds[1::2])]
+
+    @staticmethod
+    def merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    @staticmethod
+    def map_ranges(ranges: List[Tuple[int, int]], table: MappingTable) -> List[Tuple[int, int]]:
+        out = []
+        for start, end in ranges:
+            for piece_start, piece_end, offset in table.split(start, end):
+                out.append((piece_start + offset, piece_end + offset))
+        return Almanac.merge_ranges(out)
+
+    def compile(self) -> MappingTable:
+        # Compose the seven layers into a single seed -> location table
+        pieces = [(0, MAX_VALUE, 0)]
+        for layer in self.layers():
+            composed = []
+            for start, end, offset in pieces:
+                for piece_start, piece_end, piece_offset in layer.split(start + offset, end + offset):
+                    piece = (piece_start - offset, piece_end - offset, offset + piece_offset)
+                    if composed and composed[-1][1] == piece[0] and composed[-1][2] == piece[2]:
+                        composed[-1] = (composed[-1][0], piece[1], piece[2])
+                    else:
+                        composed.append(piece)
+            pieces = composed
+        self.compiled = MappingTable([(start + offset, start, end - start) for start, end, offset in pieces])
+        return self.compiled
+
+    def find_lowest_location_seed_range(self, brute_force: bool = False) -> int | None:
+        # None if there are no seeds at all, in every mode
+        if brute_force:
+            return self.find_lowest_location_seed_range_brute_force()
+        if self.compiled is not None:
+            return min(
+                (self.compiled.min_over(start, end) for start, end in self.seed_ranges() if start < end),
+                default=None,
+            )
+        ranges = self.merge_ranges(self.seed_ranges())
+        for layer in self.layers():
+            ranges = self.map_ranges(ranges, layer)
+        return min((start for start, _ in ranges), default=None)
+
+    def find_lowest_location_in_range(self, start: int, end: int, chunk_size: int = CHUNK_SIZE) -> int | None:
+        # None for an empty range
+        min_so_far = None
+        for chunk_start in range(start, end, chunk_size):
+            seeds = np.arange(chunk_start, min(end, chunk_start + chunk_size), dtype=np.int64)
+            chunk_min = int(self.find_locations(seeds).min())
+            if min_so_far is None or chunk_min < min_so_far:
+                min_so_far = chunk_min
+        return min_so_far
+
+    def find_lowest_location_seed_range_vectorized(self, chunk_size: int = CHUNK_SIZE) -> int | None:
+        # Same brute-force walk as below, but chunk_size seeds at a time through NumPy.
+        # Empty seed ranges are skipped; None if there are no seeds at all.
+        return min(
+            (
+                self.find_lowest_location_in_range(start, end, chunk_size)
+                for start, end in tqdm(self.seed_ranges())
+                if start < end
+            ),
+            default=None,
+        )
+
+    def find_lowest_location_seed_range_parallel(self, workers: int, chunks_per_worker: int = 4) -> int | None:
+        # Empty seed ranges produce no chunks; None if there are no seeds at all
+        chunks = split_seed_ranges(self.seed_ranges(), workers * chunks_per_worker)
+        min_so_far = None
+        # The almanac is shipped once per worker through the initializer, not once per chunk
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(self,)) as executor:
+            futures = {executor.submit(_lowest_location_in_chunk, chunk): chunk for chunk in chunks}
+            with tqdm(total=sum(end - start for start, end in chunks), unit="seed") as progress:
+                for future in as_completed(futures):
+                    chunk_min = future.result()
+                    if min_so_far is None or chunk_min < min_so_far:
+                        min_so_far = chunk_min
+                    start, end = futures[future]
+                    progress.update(end - start)
+        return min_so_far
+
+    def find_lowest_location_seed_range_brute_force(self) -> int | None:
         even = [seed for i, seed in enumerate(self.seeds) if i % 2 == 0]
         odd = [seed for i, seed in enumerate(self.seeds) if i % 2 == 1]
-        min_so_far = float("inf")
+        min_so_far = None
         for seed_start, seed_end in tqdm(zip(even, odd)):
             for seed in tqdm(range(seed_start, seed_start + seed_end)):
                 # print(seed, self.find_location(seed))
-                min_so_far = min(min_so_far, self.find_location(seed))
+                location = self.find_location(seed)
+                if min_so_far is None or location < min_so_far:
+                    min_so_far = location
         return min_so_far
 
 
-def seed_fertilizer(filename):
+def split_seed_ranges(ranges: List[Tuple[int, int]], parts: int) -> List[Tuple[int, int]]:
+    # Cut the ranges into chunks of roughly total / parts seeds each
+    total = sum(end - start for start, end in ranges)
+    if total == 0:
+        return []
+    chunk_size = -(-total // max(parts, 1))
+    chunks = []
+    for start, end in ranges:
+        for chunk_start in range(start, end, chunk_size):
+            chunks.append((chunk_start, min(end, chunk_start + chunk_size)))
+    return chunks
+
+
+_worker_almanac: Almanac | None = None
+
+
+def _init_worker(almanac: Almanac) -> None:
+    global _worker_almanac
+    _worker_almanac = almanac
+
+
+def _lowest_location_in_chunk(chunk: Tuple[int, int]) -> int:
+    start, end = chunk
+    return _worker_almanac.find_lowest_location_in_range(start, end)
+
+
+def seed_fertilizer(filename, workers: int | None = None):
     almanac = Almanac.parse_input(utils.read_input(filename))
     print(almanac.find_lowest_location())
-    print(almanac.find_lowest_location_seed_range())
+    if workers:
+        print(almanac.find_lowest_location_seed_range_parallel(workers))
+    else:
+        print(almanac.find_lowest_location_seed_range())
 
 
 def test_samples():
@@ -149,8 +350,47 @@ def test_samples():
     a = Almanac.parse_input(text)
     assert a.find_location(82) == 46
     assert len(Almanac.parse_correlation(sample, Mappings.seed_to_soil)) == 2
+    assert a.seed_to_soil.lookup(98) == 50 and a.seed_to_soil.lookup(100) == 100
+    assert a.seed_ranges() == [(79, 93), (55, 68)]
+    assert Almanac.map_ranges([(40, 60)], a.seed_to_soil) == [(40, 50), (52, 62)]
+    assert a.find_lowest_location_seed_range() == 46
+    assert a.find_lowest_location_seed_range(brute_force=True) == 46
+    seeds = np.arange(100, dtype=np.int64)
+    assert a.find_locations(seeds).tolist() == [a.find_location(seed) for seed in range(100)]
+    assert a.find_lowest_location_seed_range_vectorized(chunk_size=4) == 46
+
+    compiled = Almanac.parse_input(text)
+    compiled.compile()
+    assert all(compiled.find_location(seed) == a.find_location(seed) for seed in range(100))
+    assert compiled.find_lowest_location() == 35
+    assert compiled.find_lowest_location_seed_range() == 46
+    compiled.seeds = [79, 14, 10, 0]
+    assert compiled.find_lowest_location_seed_range() == 46
+    compiled.seeds = [10, 0]
+    assert compiled.find_lowest_location_seed_range() is None
+    compiled.seeds = a.seeds
+    assert compiled.find_locations(seeds).tolist() == a.find_locations(seeds).tolist()
+
+    assert split_seed_ranges([(0, 10), (20, 25)], 3) == [(0, 5), (5, 10), (20, 25)]
+    assert a.find_lowest_location_seed_range_parallel(workers=2) == 46
+
+    # Seed pairs of length 0 are skipped by the batch paths
+    empty = Almanac.parse_input(text)
+    empty.seeds = [79, 14, 10, 0]
+    assert empty.find_lowest_location_seed_range() == 46
+    assert empty.find_lowest_location_seed_range(brute_force=True) == 46
+    assert empty.find_lowest_location_seed_range_vectorized(chunk_size=4) == 46
+    assert empty.find_lowest_location_seed_range_parallel(workers=2) == 46
+    empty.seeds = [10, 0]
+    assert empty.find_lowest_location_seed_range() is None
+    assert empty.find_lowest_location_seed_range(brute_force=True) is None
+    assert empty.find_lowest_location_seed_range_vectorized() is None
+    assert empty.find_lowest_location_seed_range_parallel(workers=2) is None
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=None, help="brute-force part 2 on N processes")
+    args = parser.parse_args()
     test_samples()
-    seed_fertilizer("src/2023_5_seed_fertilizer.txt")
+    seed_fertilizer("src/2023_5_seed_fertilizer.txt", workers=args.workers)
@@ -1,12 +1,50 @@
+import mmap
+import os
+import tempfile
+
+
 def read_input(filename):
     with open(filename, 'r') as f:
         return f.read()
 
 
-def read_by_line(filename):
-    content = read_input(filename)
-    for line in content.split('\n'):
-        yield line
+def read_by_line(filename, binary=False, use_mmap=False):
+    # Streams lines without their newline. Like read_input(filename).split('\n'), a file
+    # that ends in a newline (or is empty) yields a final empty line. All modes drop the \r
+    # of CRLF endings, as text mode does, so they yield the same lines.
+    if use_mmap:
+        for line in read_by_line_mmap(filename):
+            yield line if binary else line.decode()
+        return
+
+    newline = b'\n' if binary else '\n'
+    ends_with_newline = True
+    with open(filename, 'rb' if binary else 'r') as f:
+        for line in f:
+            ends_with_newline = line.endswith(newline)
+            if ends_with_newline:
+                line = line[:-1]
+            yield line.removesuffix(b'\r') if binary else line
+    if ends_with_newline:
+        yield newline[:0]
+
+
+def read_by_line_mmap(filename):
+    # Memory-mapped line reader yielding bytes, with the same trailing empty line as read_by_line.
+    # A trailing \r is stripped so CRLF files give the same lines as text mode.
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            start = 0
+            while True:
+                end = mapped.find(b'\n', start)
+                if end == -1:
+                    yield mapped[start:].removesuffix(b'\r')
+                    return
+                yield mapped[start:end].removesuffix(b'\r')
+                start = end + 1
 
 
 def create_template(name):
@@ -38,5 +76,31 @@ if __name__ == "__main__":
         f.write("")
 
 
+def test_samples():
+    contents = {
+        'lf.txt': b'ab\ncd',
+        'crlf.txt': b'ab\r\ncd\r\n',
+        'empty.txt': b'',
+        'trailing.txt': b'ab\n\ncd\n',
+    }
+    expected = {
+        'lf.txt': ['ab', 'cd'],
+        'crlf.txt': ['ab', 'cd', ''],
+        'empty.txt': [''],
+        'trailing.txt': ['ab', '', 'cd', ''],
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for name, content in contents.items():
+            filename = os.path.join(directory, name)
+            with open(filename, 'wb') as f:
+                f.write(content)
+            lines = expected[name]
+            assert list(read_by_line(filename)) == lines
+            assert list(read_by_line(filename, use_mmap=True)) == lines
+            assert list(read_by_line(filename, binary=True)) == [line.encode() for line in lines]
+            assert list(read_by_line(filename, binary=True, use_mmap=True)) == [line.encode() for line in lines]
+
+
 if __name__ == "__main__":
+    test_samples()
     create_template('2023_09_mirage_maintenance')